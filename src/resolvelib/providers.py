@@ -57,6 +57,16 @@ class AbstractProvider(object):
         parameter of the built-in sorting function). The smaller the value is,
         the more preferred this requirement is (i.e. the sorting function
         is called with ``reverse=False``).
+
+        After backtracking, the choice is first narrowed to unsatisfied
+        identifiers involved in ``backtrack_causes``, either as the identifier
+        of a requirement or of its parent. This method is then only consulted
+        to order those identifiers, and not at all if only one is left. All
+        unsatisfied identifiers are considered again once none of them remain.
+
+        The resolver may reuse a previously returned value for ``identifier``
+        until its requirement information, its pin, or the backtrack causes
+        change.
         """
         raise NotImplementedError
 
@@ -86,6 +96,10 @@ class AbstractProvider(object):
         * An collection of candidates.
         * An iterable of candidates. This will be consumed immediately into a
           list of candidates.
+
+        The resolver does not filter the returned candidates itself, so this
+        is the place to filter them in bulk (e.g. by intersecting version
+        ranges) instead of checking candidates one by one.
         """
         raise NotImplementedError
 
@@ -105,6 +119,10 @@ class AbstractProvider(object):
 
         This should return a collection of requirements that `candidate`
         specifies as its dependencies.
+
+        The resolver calls this at most once per candidate object, and reuses
+        the result if the candidate is tried again after backtracking. Each
+        candidate passed here is kept alive until the resolution ends.
         """
         raise NotImplementedError
 
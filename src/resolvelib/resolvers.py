@@ -46,11 +46,11 @@ class Criterion(object):
 
     This holds three attributes:
 
-    * `information` is a collection of `RequirementInformation` pairs.
-      Each pair is a requirement contributing to this criterion, and the
-      candidate that provides the requirement.
-    * `incompatibilities` is a collection of all known not-to-work candidates
-      to exclude from consideration.
+    * `information` is a tuple of `RequirementInformation` pairs. Each pair
+      is a requirement contributing to this criterion, and the candidate that
+      provides the requirement.
+    * `incompatibilities` is a tuple of all known not-to-work candidates to
+      exclude from consideration.
     * `candidates` is a collection containing all possible candidates deducted
       from the union of contributing requirements and known incompatibilities.
       It should never be empty, except when the criterion is an attribute of a
@@ -74,10 +74,10 @@ class Criterion(object):
         return "Criterion({})".format(requirements)
 
     def iter_requirement(self):
-        return (i.requirement for i in self.information)
+        return iter(map(operator.itemgetter(0), self.information))
 
     def iter_parent(self):
-        return (i.parent for i in self.information)
+        return iter(map(operator.itemgetter(1), self.information))
 
 
 class ResolutionError(ResolverException):
@@ -112,6 +112,11 @@ class Resolution(object):
         self._p = provider
         self._r = reporter
         self._states = []
+        self._backtrack_cause_names = set()
+        self._preference_cache = {}
+        self._satisfying_cache = {}
+        self._dependencies_cache = {}
+        self._dependency_names_cache = {}
 
     @property
     def state(self):
@@ -134,15 +139,15 @@ class Resolution(object):
         )
         self._states.append(state)
 
-    def _add_to_criteria(self, criteria, requirement, parent):
+    def _add_to_criteria(self, criteria, requirement, parent, journal=None):
         self._r.adding_requirement(requirement=requirement, parent=parent)
 
         identifier = self._p.identify(requirement_or_candidate=requirement)
         criterion = criteria.get(identifier)
         if criterion:
-            incompatibilities = list(criterion.incompatibilities)
+            incompatibilities = criterion.incompatibilities
         else:
-            incompatibilities = []
+            incompatibilities = ()
 
         matches = self._p.find_matches(
             identifier=identifier,
@@ -158,11 +163,9 @@ class Resolution(object):
             ),
         )
 
+        information = (RequirementInformation(requirement, parent),)
         if criterion:
-            information = list(criterion.information)
-            information.append(RequirementInformation(requirement, parent))
-        else:
-            information = [RequirementInformation(requirement, parent)]
+            information = criterion.information + information
 
         criterion = Criterion(
             candidates=build_iter_view(matches),
@@ -171,6 +174,8 @@ class Resolution(object):
         )
         if not criterion.candidates:
             raise RequirementsConflicted(criterion)
+        if journal is not None:
+            journal.append((identifier, criteria.get(identifier)))
         criteria[identifier] = criterion
 
     def _remove_information_from_criteria(self, criteria, parents):
@@ -184,58 +189,159 @@ class Resolution(object):
         """
         if not parents:
             return
+        identify = self._p.identify
         for key, criterion in criteria.items():
+            information = tuple(
+                information
+                for information in criterion.information
+                if information[1] is None
+                or identify(information[1]) not in parents
+            )
+            # Keep criteria that lose nothing as-is. Replacing them would not
+            # change anything, but invalidate results cached for them.
+            if len(information) == len(criterion.information):
+                continue
             criteria[key] = Criterion(
                 criterion.candidates,
-                [
-                    information
-                    for information in criterion.information
-                    if (
-                        information[1] is None
-                        or self._p.identify(information[1]) not in parents
-                    )
-                ],
+                information,
                 criterion.incompatibilities,
             )
 
     def _get_preference(self, name):
-        return self._p.get_preference(
+        # Criteria are never mutated, only replaced, so a cached preference is
+        # valid as long as both the criterion and the pin are unchanged.
+        state = self.state
+        criterion = state.criteria[name]
+        pin = state.mapping.get(name)
+        try:
+            cached_criterion, cached_pin, preference = self._preference_cache[
+                name
+            ]
+        except KeyError:
+            pass
+        else:
+            if cached_criterion is criterion and cached_pin is pin:
+                return preference
+        preference = self._p.get_preference(
             identifier=name,
-            resolutions=self.state.mapping,
+            resolutions=state.mapping,
             candidates=IteratorMapping(
-                self.state.criteria,
+                state.criteria,
                 operator.attrgetter("candidates"),
             ),
             information=IteratorMapping(
-                self.state.criteria,
+                state.criteria,
                 operator.attrgetter("information"),
             ),
-            backtrack_causes=self.state.backtrack_causes,
+            backtrack_causes=state.backtrack_causes,
         )
+        self._preference_cache[name] = (criterion, pin, preference)
+        return preference
+
+    def _get_backtrack_cause_names(self, causes):
+        """Identify packages involved in the conflict described by ``causes``.
+
+        Both the conflicting requirements and their parents are included, since
+        either side may have to be re-pinned to resolve the conflict.
+        """
+        names = set()
+        for requirement, parent in causes:
+            names.add(self._p.identify(requirement_or_candidate=requirement))
+            if parent is not None:
+                names.add(self._p.identify(requirement_or_candidate=parent))
+        return names
 
     def _is_current_pin_satisfying(self, name, criterion):
         try:
             current_pin = self.state.mapping[name]
         except KeyError:
             return False
-        return all(
-            self._p.is_satisfied_by(requirement=r, candidate=current_pin)
+        # Like preferences, the result holds while neither the criterion nor
+        # the pin is replaced. This is checked for every criterion each round.
+        # If the pin was shown to satisfy an earlier criterion, requirements
+        # carried over from it need not be checked again either.
+        verified = ()
+        try:
+            cached_criterion, cached_pin, satisfied = self._satisfying_cache[
+                name
+            ]
+        except KeyError:
+            pass
+        else:
+            if cached_pin is current_pin:
+                if cached_criterion is criterion:
+                    return satisfied
+                if satisfied:
+                    verified = {
+                        id(r) for r in cached_criterion.iter_requirement()
+                    }
+        is_satisfied_by = self._p.is_satisfied_by
+        satisfied = all(
+            is_satisfied_by(requirement=r, candidate=current_pin)
             for r in criterion.iter_requirement()
+            if id(r) not in verified
+        )
+        self._satisfying_cache[name] = (criterion, current_pin, satisfied)
+        return satisfied
+
+    def _get_dependencies(self, candidate):
+        # Dependencies of a candidate never change, so they are only requested
+        # once per resolution, however often the candidate is tried again after
+        # backtracking. Candidates are not required to be hashable and are
+        # keyed by id() instead; each one is kept alive in the cache so its id
+        # cannot be reused by another object.
+        try:
+            return self._dependencies_cache[id(candidate)][1]
+        except KeyError:
+            pass
+        dependencies = list(self._p.get_dependencies(candidate=candidate))
+        self._dependencies_cache[id(candidate)] = (candidate, dependencies)
+        return dependencies
+
+    def _get_dependency_names(self, candidate):
+        # The candidate is kept alive by the dependencies cache, so its id is
+        # safe to use as a key here as well.
+        try:
+            return self._dependency_names_cache[id(candidate)]
+        except KeyError:
+            pass
+        names = tuple(
+            self._p.identify(requirement_or_candidate=d)
+            for d in self._get_dependencies(candidate)
         )
+        self._dependency_names_cache[id(candidate)] = names
+        return names
 
     def _get_updated_criteria(self, candidate):
-        criteria = self.state.criteria.copy()
-        for requirement in self._p.get_dependencies(candidate=candidate):
-            self._add_to_criteria(criteria, requirement, parent=candidate)
-        return criteria
+        """Add dependencies of ``candidate`` to the current criteria.
+
+        The criteria are updated in place. Each replaced entry is recorded, so
+        if a dependency conflicts, only those entries are restored before
+        `RequirementsConflicted` is re-raised.
+        """
+        criteria = self.state.criteria
+        journal = []
+        try:
+            for requirement in self._get_dependencies(candidate):
+                self._add_to_criteria(
+                    criteria, requirement, parent=candidate, journal=journal
+                )
+        except RequirementsConflicted:
+            for identifier, criterion in reversed(journal):
+                if criterion is None:
+                    del criteria[identifier]
+                else:
+                    criteria[identifier] = criterion
+            raise
 
     def _attempt_to_pin_criterion(self, name):
         criterion = self.state.criteria[name]
+        is_satisfied_by = self._p.is_satisfied_by
 
         causes = []
         for candidate in criterion.candidates:
             try:
-                criteria = self._get_updated_criteria(candidate)
+                self._get_updated_criteria(candidate)
             except RequirementsConflicted as e:
                 self._r.rejecting_candidate(e.criterion, candidate)
                 causes.append(e.criterion)
@@ -246,19 +352,20 @@ class Resolution(object):
             # faulty provider, we will raise an error to notify the implementer
             # to fix find_matches() and/or is_satisfied_by().
             satisfied = all(
-                self._p.is_satisfied_by(requirement=r, candidate=candidate)
+                is_satisfied_by(requirement=r, candidate=candidate)
                 for r in criterion.iter_requirement()
             )
             if not satisfied:
                 raise InconsistentCandidate(candidate, criterion)
+            self._satisfying_cache[name] = (criterion, candidate, True)
 
             self._r.pinning(candidate=candidate)
-            self.state.criteria.update(criteria)
 
             # Put newly-pinned candidate at the end. This is essential because
             # backtracking looks at this mapping to get the last pin.
-            self.state.mapping.pop(name, None)
-            self.state.mapping[name] = candidate
+            mapping = self.state.mapping
+            mapping.pop(name, None)
+            mapping[name] = candidate
 
             return []
 
@@ -266,8 +373,8 @@ class Resolution(object):
         # end, signal for backtracking.
         return causes
 
-    def _backtrack(self):
-        """Perform backtracking.
+    def _backjump(self, causes, incompatible_names):
+        """Perform backjumping.
 
         When we enter here, the stack is like this::
 
@@ -283,48 +390,91 @@ class Resolution(object):
 
         Each iteration of the loop will:
 
-        1.  Discard Z.
-        2.  Discard Y but remember its incompatibility information gathered
+        1.  Identify Y. The conflict is not necessarily caused by the latest
+            pin. Given requirements A, B and C, where A1 and B1 conflict, the
+            last pin may be C1, which has nothing to do with the conflict, so
+            states are discarded until one pins a package that ``causes``
+            refer to, or that depends on one. If no pin does, or once a
+            patched state has failed in step 5a, Y is the latest pin.
+        2.  Discard Z.
+        3.  Discard Y but remember its incompatibility information gathered
             previously, and the failure we're dealing with right now.
-        3.  Push a new state Y' based on X, and apply the incompatibility
+        4.  Push a new state Y' based on X, and apply the incompatibility
             information from Y to Y'.
-        4a. If this causes Y' to conflict, we need to backtrack again. Make Y'
+        5a. If this causes Y' to conflict, we need to backtrack again. Make Y'
             the new Z and go back to step 2.
-        4b. If the incompatibilities apply cleanly, end backtracking.
+        5b. If the incompatibilities apply cleanly, end backtracking.
+
+        :param causes: Requirement information that caused the conflict.
+        :param incompatible_names: Identifiers of packages involved in
+            ``causes``, as returned by ``_get_backtrack_cause_names()``.
         """
+        jump = True
         while len(self._states) >= 3:
             # Remove the state that triggered backtracking.
             del self._states[-1]
 
+            # Jump back to the last pin related to the conflict. If no pin is,
+            # only undo the latest one, so an unrelated pin is not marked
+            # incompatible. The root state is never a candidate.
+            if jump:
+                for index in range(len(self._states) - 1, 0, -1):
+                    mapping = self._states[index].mapping
+                    pinned = next(reversed(mapping))
+                    if pinned in incompatible_names:
+                        break
+                    dependency_names = self._get_dependency_names(
+                        mapping[pinned]
+                    )
+                    if not incompatible_names.isdisjoint(dependency_names):
+                        break
+                else:
+                    index = len(self._states) - 1
+                del self._states[index + 1 :]
+
             # Retrieve the last candidate pin and known incompatibilities.
             broken_state = self._states.pop()
             name, candidate = broken_state.mapping.popitem()
+
             incompatibilities_from_broken = [
-                (k, list(v.incompatibilities))
+                (k, v.incompatibilities)
                 for k, v in broken_state.criteria.items()
             ]
 
             # Also mark the newly known incompatibility.
-            incompatibilities_from_broken.append((name, [candidate]))
+            incompatibilities_from_broken.append((name, (candidate,)))
 
             # Create a new state from the last known-to-work one, and apply
             # the previously gathered incompatibility information.
             def _patch_criteria():
+                criteria = self.state.criteria
                 for k, incompatibilities in incompatibilities_from_broken:
                     if not incompatibilities:
                         continue
                     try:
-                        criterion = self.state.criteria[k]
+                        criterion = criteria[k]
                     except KeyError:
                         continue
+                    # The restored state shares this criterion's knowledge with
+                    # the broken one; nothing needs re-applying.
+                    if incompatibilities is criterion.incompatibilities:
+                        continue
+                    # Only apply what is not already known. Candidates are not
+                    # required to be hashable, so compare by identity.
+                    known = {id(c) for c in criterion.incompatibilities}
+                    incompatibilities = tuple(
+                        c for c in incompatibilities if id(c) not in known
+                    )
+                    if not incompatibilities:
+                        continue
                     matches = self._p.find_matches(
                         identifier=k,
                         requirements=IteratorMapping(
-                            self.state.criteria,
+                            criteria,
                             operator.methodcaller("iter_requirement"),
                         ),
                         incompatibilities=IteratorMapping(
-                            self.state.criteria,
+                            criteria,
                             operator.attrgetter("incompatibilities"),
                             {k: incompatibilities},
                         ),
@@ -332,11 +482,12 @@ class Resolution(object):
                     candidates = build_iter_view(matches)
                     if not candidates:
                         return False
-                    incompatibilities.extend(criterion.incompatibilities)
-                    self.state.criteria[k] = Criterion(
+                    criteria[k] = Criterion(
                         candidates=candidates,
-                        information=list(criterion.information),
-                        incompatibilities=incompatibilities,
+                        information=criterion.information,
+                        incompatibilities=(
+                            incompatibilities + criterion.incompatibilities
+                        ),
                     )
                 return True
 
@@ -348,7 +499,9 @@ class Resolution(object):
                 return True
 
             # State does not work after applying known incompatibilities.
-            # Try the still previous state.
+            # Try the still previous state. ``causes`` do not explain this
+            # failure, so stop jumping and only undo one pin at a time.
+            jump = False
 
         # No way to backtrack anymore.
         return False
@@ -362,6 +515,8 @@ class Resolution(object):
         # Initialize the root state.
         self._states = [
             State(
+                # Insertion order doubles as pin order, which backjumping
+                # relies on. Plain dicts are not ordered on Python 2.
                 mapping=collections.OrderedDict(),
                 criteria={},
                 backtrack_causes=[],
@@ -371,20 +526,22 @@ class Resolution(object):
             try:
                 self._add_to_criteria(self.state.criteria, r, parent=None)
             except RequirementsConflicted as e:
-                raise ResolutionImpossible(e.criterion.information)
+                raise ResolutionImpossible(list(e.criterion.information))
 
         # The root state is saved as a sentinel so the first ever pin can have
         # something to backtrack to if it fails. The root state is basically
         # pinning the virtual "root" package in the graph.
         self._push_new_state()
 
+        is_current_pin_satisfying = self._is_current_pin_satisfying
         for round_index in range(max_rounds):
             self._r.starting_round(index=round_index)
 
+            criteria = self.state.criteria
             unsatisfied_names = [
                 key
-                for key, criterion in self.state.criteria.items()
-                if not self._is_current_pin_satisfying(key, criterion)
+                for key, criterion in criteria.items()
+                if not is_current_pin_satisfying(key, criterion)
             ]
 
             # All criteria are accounted for. Nothing more to pin, we are done!
@@ -393,12 +550,24 @@ class Resolution(object):
                 return self.state
 
             # keep track of satisfied names to calculate diff after pinning
-            satisfied_names = set(self.state.criteria.keys()) - set(
-                unsatisfied_names
-            )
+            satisfied_names = set(criteria.keys()) - set(unsatisfied_names)
+
+            # Work on criteria involved in the last conflict first. Narrowing
+            # the selection also avoids calling get_preference() for every
+            # unsatisfied criterion in every round.
+            cause_names = [
+                key
+                for key in unsatisfied_names
+                if key in self._backtrack_cause_names
+            ]
+            if cause_names:
+                unsatisfied_names = cause_names
 
             # Choose the most preferred unpinned criterion to try.
-            name = min(unsatisfied_names, key=self._get_preference)
+            if len(unsatisfied_names) == 1:
+                name = unsatisfied_names[0]
+            else:
+                name = min(unsatisfied_names, key=self._get_preference)
             failure_causes = self._attempt_to_pin_criterion(name)
 
             if failure_causes:
@@ -406,8 +575,13 @@ class Resolution(object):
                 # Backtrack if pinning fails. The backtrack process puts us in
                 # an unpinned state, so we can work on it in the next round.
                 self._r.resolving_conflicts(causes=causes)
-                success = self._backtrack()
+                incompatible_names = self._get_backtrack_cause_names(causes)
+                success = self._backjump(causes, incompatible_names)
                 self.state.backtrack_causes[:] = causes
+                self._backtrack_cause_names = incompatible_names
+                # Backtrack causes are passed to get_preference(), so all
+                # cached preferences are stale now.
+                self._preference_cache.clear()
 
                 # Dead ends everywhere. Give up.
                 if not success:
@@ -417,12 +591,12 @@ class Resolution(object):
                 # (unsatisfied names that were previously satisfied)
                 newly_unsatisfied_names = {
                     key
-                    for key, criterion in self.state.criteria.items()
+                    for key, criterion in criteria.items()
                     if key in satisfied_names
-                    and not self._is_current_pin_satisfying(key, criterion)
+                    and not is_current_pin_satisfying(key, criterion)
                 }
                 self._remove_information_from_criteria(
-                    self.state.criteria, newly_unsatisfied_names
+                    criteria, newly_unsatisfied_names
                 )
                 # Pinning was successful. Push a new state to do another pin.
                 self._push_new_state()
@@ -432,22 +606,28 @@ class Resolution(object):
         raise ResolutionTooDeep(max_rounds)
 
 
-def _has_route_to_root(criteria, key, all_keys, connected):
+def _has_route_to_root(parents_of, key, connected):
     if key in connected:
         return True
-    if key not in criteria:
-        return False
-    for p in criteria[key].iter_parent():
-        try:
-            pkey = all_keys[id(p)]
-        except KeyError:
-            continue
-        if pkey in connected:
-            connected.add(key)
-            return True
-        if _has_route_to_root(criteria, pkey, all_keys, connected):
-            connected.add(key)
-            return True
+
+    # Walk parents depth-first without recursion, so long dependency chains
+    # cannot exceed the recursion limit, and each key is visited once. Every
+    # visited key maps to the key it was reached from, so the whole route can
+    # be marked as connected once the root (or a connected key) is reached.
+    reached_from = {key: key}
+    stack = [key]
+    while stack:
+        current = stack.pop()
+        for pkey in parents_of.get(current, ()):
+            if pkey in connected:
+                while current != key:
+                    connected.add(current)
+                    current = reached_from[current]
+                connected.add(key)
+                return True
+            if pkey not in reached_from:
+                reached_from[pkey] = current
+                stack.append(pkey)
     return False
 
 
@@ -459,20 +639,27 @@ def _build_result(state):
     all_keys = {id(v): k for k, v in mapping.items()}
     all_keys[id(None)] = None
 
+    # Resolve each criterion's parents to keys once. Parents that are not
+    # pinned in the result do not contribute edges and are left out.
+    parents_of = {
+        key: [
+            all_keys[id(p)]
+            for p in criterion.iter_parent()
+            if id(p) in all_keys
+        ]
+        for key, criterion in state.criteria.items()
+    }
+
     graph = DirectedGraph()
     graph.add(None)  # Sentinel as root dependencies' parent.
 
     connected = {None}
-    for key, criterion in state.criteria.items():
-        if not _has_route_to_root(state.criteria, key, all_keys, connected):
+    for key, pkeys in parents_of.items():
+        if not _has_route_to_root(parents_of, key, connected):
             continue
         if key not in graph:
             graph.add(key)
-        for p in criterion.iter_parent():
-            try:
-                pkey = all_keys[id(p)]
-            except KeyError:
-                continue
+        for pkey in pkeys:
             if pkey not in graph:
                 graph.add(pkey)
             graph.connect(pkey, key)
@@ -6,6 +6,7 @@ from typing import (
     List,
     Mapping,
     Optional,
+    Tuple,
 )
 
 from .providers import AbstractProvider, AbstractResolver
@@ -19,8 +20,8 @@ class RequirementInformation(tuple, Generic[RT, CT]):
 
 class Criterion(Generic[RT, CT, KT]):
     candidates: IterableView[CT]
-    information: Collection[RequirementInformation[RT, CT]]
-    incompatibilities: List[CT]
+    information: Tuple[RequirementInformation[RT, CT], ...]
+    incompatibilities: Tuple[CT, ...]
     @classmethod
     def from_requirement(
         cls,
@@ -1,3 +1,5 @@
+import collections
+import sys
 from typing import (
     Any,
     Iterable,
@@ -26,6 +28,8 @@ from resolvelib.resolvers import (
     RequirementInformation,
     RequirementsConflicted,
     Resolution,
+    State,
+    _build_result,
 )
 
 
@@ -269,3 +273,363 @@ def test_pin_conflict_with_self(monkeypatch, reporter):
     assert result.mapping["parent"][1] == Version("1")
     assert result.mapping["child"][1] == Version("1")
     assert result.mapping["grandchild"][1] == Version("1")
+
+
+def test_backjump_skips_unrelated_pins():
+    # "a" and "b" conflict on "x" when a2 is chosen. "c" is pinned between
+    # them but has nothing to do with the conflict, so the resolver should jump
+    # back to "a" directly instead of marking c1 as incompatible.
+    all_candidates = {
+        "a": [("a", 2, [("x", {2})]), ("a", 1, [("x", {1})])],
+        "b": [("b", 1, [("x", {1})])],
+        "c": [("c", 1, [])],
+        "x": [("x", 2, []), ("x", 1, [])],
+    }
+    preference = ["a", "c", "b", "x"]
+    excluded = {name: set() for name in all_candidates}
+
+    class Provider(AbstractProvider):
+        def identify(self, requirement_or_candidate):
+            return requirement_or_candidate[0]
+
+        def get_preference(self, identifier, **_):
+            return preference.index(identifier)
+
+        def get_dependencies(self, candidate):
+            return candidate[2]
+
+        def find_matches(self, identifier, requirements, incompatibilities):
+            bad_versions = {c[1] for c in incompatibilities[identifier]}
+            excluded[identifier].update(bad_versions)
+            return [
+                c
+                for c in all_candidates[identifier]
+                if all(c[1] in r[1] for r in requirements[identifier])
+                and c[1] not in bad_versions
+            ]
+
+        def is_satisfied_by(self, requirement, candidate):
+            return candidate[1] in requirement[1]
+
+    resolver = Resolver(Provider(), BaseReporter())
+    result = resolver.resolve([("a", {1, 2}), ("b", {1}), ("c", {1})])
+
+    assert {k: v[1] for k, v in result.mapping.items()} == {
+        "a": 1,
+        "b": 1,
+        "c": 1,
+        "x": 1,
+    }
+    assert excluded["a"] == {2}
+    assert not excluded["c"]
+
+
+def test_backjump_falls_back_to_backtracking_after_failed_patch():
+    # Pins are d1, a2, b1, then c1 conflicts with d1 on "d". The conflict names
+    # "c" and "d", so b1 is undone first, which leaves "b" without candidates.
+    # a2 is what requires b1, but is not named by the conflict; it must still
+    # be undone before d1 is blamed, or a1 is never tried.
+    all_candidates = {
+        "a": [("a", 2, [("b", {1})]), ("a", 1, [])],
+        "b": [("b", 1, [("c", {1})])],
+        "c": [("c", 1, [("d", {2})])],
+        "d": [("d", 1, [])],
+    }
+    preference = ["b", "c", "d", "a"]
+
+    class Provider(AbstractProvider):
+        def identify(self, requirement_or_candidate):
+            return requirement_or_candidate[0]
+
+        def get_preference(self, identifier, **_):
+            return preference.index(identifier)
+
+        def get_dependencies(self, candidate):
+            return candidate[2]
+
+        def find_matches(self, identifier, requirements, incompatibilities):
+            bad_versions = {c[1] for c in incompatibilities[identifier]}
+            return [
+                c
+                for c in all_candidates[identifier]
+                if all(c[1] in r[1] for r in requirements[identifier])
+                and c[1] not in bad_versions
+            ]
+
+        def is_satisfied_by(self, requirement, candidate):
+            return candidate[1] in requirement[1]
+
+    resolver = Resolver(Provider(), BaseReporter())
+    result = resolver.resolve([("a", {1, 2}), ("d", {1})])
+
+    assert {k: v[1] for k, v in result.mapping.items()} == {"a": 1, "d": 1}
+
+
+def test_pin_attempt_respects_criteria_of_other_identifiers():
+    # find_matches() may read requirements of identifiers other than the one
+    # asked for; here "b[x]" also honours requirements on "b" (like extras do
+    # in pip). n1 is first pinned while "b" is unconstrained, then unpinned by
+    # backjumping; when it is pinned again, p1 has added "b==1", so "b[x]"
+    # must be narrowed down to 1 as well.
+    all_candidates = {
+        "p": [("p", 2, [("z", {1})]), ("p", 1, [("b", {1})])],
+        "n": [("n", 1, [("b[x]", {1, 2})])],
+        "z": [("z", 1, [("y", {2})])],
+        "b": [("b", 2, []), ("b", 1, [])],
+        "b[x]": [("b[x]", 2, [("y", {1})]), ("b[x]", 1, [("y", {1})])],
+        "y": [("y", 2, []), ("y", 1, [])],
+    }
+    preference = ["p", "n", "z", "b", "b[x]", "y"]
+
+    class Provider(AbstractProvider):
+        def identify(self, requirement_or_candidate):
+            return requirement_or_candidate[0]
+
+        def get_preference(self, identifier, **_):
+            return preference.index(identifier)
+
+        def get_dependencies(self, candidate):
+            return candidate[2]
+
+        def find_matches(self, identifier, requirements, incompatibilities):
+            reqs = list(requirements[identifier])
+            if identifier == "b[x]":
+                reqs.extend(requirements.get("b", ()))
+            bad_versions = {c[1] for c in incompatibilities[identifier]}
+            return [
+                c
+                for c in all_candidates[identifier]
+                if all(c[1] in r[1] for r in reqs) and c[1] not in bad_versions
+            ]
+
+        def is_satisfied_by(self, requirement, candidate):
+            return candidate[1] in requirement[1]
+
+    resolver = Resolver(Provider(), BaseReporter())
+    result = resolver.resolve([("p", {1, 2}), ("n", {1})])
+
+    assert {k: v[1] for k, v in result.mapping.items()} == {
+        "p": 1,
+        "n": 1,
+        "b": 1,
+        "b[x]": 1,
+        "y": 1,
+    }
+
+
+def test_preference_requeried_only_for_changed_criteria():
+    # Preferences are reused while an identifier's criterion and pin are the
+    # same. Pinning a1 replaces the criterion of "c", so only "c" is asked for
+    # again; "b" is not.
+    all_candidates = {
+        "a": [("a", 1, [("c", {1})])],
+        "b": [("b", 1, [])],
+        "c": [("c", 1, [])],
+    }
+    queried = []
+
+    class Provider(AbstractProvider):
+        def identify(self, requirement_or_candidate):
+            return requirement_or_candidate[0]
+
+        def get_preference(self, identifier, **_):
+            queried.append(identifier)
+            return identifier
+
+        def get_dependencies(self, candidate):
+            return candidate[2]
+
+        def find_matches(self, identifier, requirements, incompatibilities):
+            return [
+                c
+                for c in all_candidates[identifier]
+                if all(c[1] in r[1] for r in requirements[identifier])
+            ]
+
+        def is_satisfied_by(self, requirement, candidate):
+            return candidate[1] in requirement[1]
+
+    resolver = Resolver(Provider(), BaseReporter())
+    result = resolver.resolve([("a", {1}), ("b", {1}), ("c", {1})])
+
+    assert set(result.mapping) == {"a", "b", "c"}
+    assert sorted(queried) == ["a", "b", "c", "c"]
+
+
+def test_dependencies_requested_once_per_candidate():
+    # Pinning b1 after a2 conflicts on "q", so the resolver backtracks and
+    # tries a1. Candidates tried again after that must not be asked for their
+    # dependencies a second time.
+    all_candidates = {
+        "a": [("a", 2, [("q", {2})]), ("a", 1, [("q", {1})])],
+        "b": [("b", 1, [("q", {1})])],
+        "q": [("q", 2, []), ("q", 1, [])],
+    }
+    requested = collections.Counter()
+    backtracked = []
+
+    class Reporter(BaseReporter):
+        def resolving_conflicts(self, causes):
+            backtracked.append(causes)
+
+    class Provider(AbstractProvider):
+        def identify(self, requirement_or_candidate):
+            return requirement_or_candidate[0]
+
+        def get_preference(self, identifier, **_):
+            return identifier
+
+        def get_dependencies(self, candidate):
+            requested[candidate[:2]] += 1
+            return candidate[2]
+
+        def find_matches(self, identifier, requirements, incompatibilities):
+            bad_versions = {c[1] for c in incompatibilities[identifier]}
+            return [
+                c
+                for c in all_candidates[identifier]
+                if all(c[1] in r[1] for r in requirements[identifier])
+                and c[1] not in bad_versions
+            ]
+
+        def is_satisfied_by(self, requirement, candidate):
+            return candidate[1] in requirement[1]
+
+    resolver = Resolver(Provider(), Reporter())
+    result = resolver.resolve([("a", {1, 2}), ("b", {1})])
+
+    assert {k: v[1] for k, v in result.mapping.items()} == {
+        "a": 1,
+        "b": 1,
+        "q": 1,
+    }
+    assert backtracked
+    assert max(requested.values()) == 1
+
+
+def test_pin_satisfaction_not_rechecked_for_unchanged_requirements():
+    # Once a pin is known to satisfy a requirement, the resolver should not
+    # ask again in later rounds, even when the criterion is replaced because
+    # b1 adds another requirement on "a".
+    all_candidates = {
+        "a": [("a", 1, [])],
+        "b": [("b", 1, [("a", {1})])],
+        "c": [("c", 1, [])],
+    }
+    asked = collections.Counter()
+
+    class Provider(AbstractProvider):
+        def identify(self, requirement_or_candidate):
+            return requirement_or_candidate[0]
+
+        def get_preference(self, identifier, **_):
+            return identifier
+
+        def get_dependencies(self, candidate):
+            return candidate[2]
+
+        def find_matches(self, identifier, requirements, incompatibilities):
+            return [
+                c
+                for c in all_candidates[identifier]
+                if all(c[1] in r[1] for r in requirements[identifier])
+            ]
+
+        def is_satisfied_by(self, requirement, candidate):
+            asked[id(requirement), candidate[:2]] += 1
+            return candidate[1] in requirement[1]
+
+    resolver = Resolver(Provider(), BaseReporter())
+    result = resolver.resolve([("a", {1}), ("b", {1}), ("c", {1})])
+
+    assert set(result.mapping) == {"a", "b", "c"}
+    assert len(asked) == 4
+    assert max(asked.values()) == 1
+
+
+def test_dependencies_added_in_provider_order():
+    # "b[x]" also honours requirements on "b" in find_matches(). a1 depends on
+    # "b" before "b[x]", and "b[x]" already has a criterion from n1; adding
+    # "b[x]" first would narrow it down without seeing "b==1".
+    all_candidates = {
+        "n": [("n", 1, [("b[x]", {1, 2})])],
+        "a": [("a", 1, [("b", {1}), ("b[x]", {1, 2})])],
+        "b": [("b", 2, []), ("b", 1, [])],
+        "b[x]": [("b[x]", 2, []), ("b[x]", 1, [])],
+    }
+    preference = ["n", "a", "b", "b[x]"]
+
+    class Provider(AbstractProvider):
+        def identify(self, requirement_or_candidate):
+            return requirement_or_candidate[0]
+
+        def get_preference(self, identifier, **_):
+            return preference.index(identifier)
+
+        def get_dependencies(self, candidate):
+            return candidate[2]
+
+        def find_matches(self, identifier, requirements, incompatibilities):
+            reqs = list(requirements[identifier])
+            if identifier == "b[x]":
+                reqs.extend(requirements.get("b", ()))
+            bad_versions = {c[1] for c in incompatibilities[identifier]}
+            return [
+                c
+                for c in all_candidates[identifier]
+                if all(c[1] in r[1] for r in reqs) and c[1] not in bad_versions
+            ]
+
+        def is_satisfied_by(self, requirement, candidate):
+            return candidate[1] in requirement[1]
+
+    resolver = Resolver(Provider(), BaseReporter())
+    result = resolver.resolve([("n", {1}), ("a", {1})])
+
+    assert {k: v[1] for k, v in result.mapping.items()} == {
+        "n": 1,
+        "a": 1,
+        "b": 1,
+        "b[x]": 1,
+    }
+
+
+def _make_state(pins, parents):
+    # Build a final state where each pinned key is required by the candidates
+    # pinned for ``parents[key]`` (None for the root).
+    mapping = collections.OrderedDict((k, (k, 1)) for k in pins)
+    criteria = {
+        key: Criterion(
+            candidates=[mapping[key]],
+            information=tuple(
+                RequirementInformation(
+                    (key, {1}), None if p is None else mapping[p]
+                )
+                for p in parents[key]
+            ),
+            incompatibilities=(),
+        )
+        for key in pins
+    }
+    return State(mapping=mapping, criteria=criteria, backtrack_causes=[])
+
+
+def test_build_result_drops_parent_cycle_without_root():
+    state = _make_state(["a", "b"], {"a": ["b"], "b": ["a"]})
+
+    result = _build_result(state)
+
+    assert result.mapping == {}
+
+
+def test_build_result_handles_chain_deeper_than_recursion_limit():
+    keys = ["p{}".format(i) for i in range(sys.getrecursionlimit() + 100)]
+    parents = {key: [parent] for parent, key in zip([None] + keys, keys)}
+    # Start from the far end of the chain, so its route to the root is not
+    # known from an earlier key.
+    state = _make_state(keys[::-1], parents)
+
+    result = _build_result(state)
+
+    assert set(result.mapping) == set(keys)
+    assert set(result.graph.iter_children(keys[-2])) == {keys[-1]}